@@ -1,22 +1,253 @@
+import io
+import copy
+import atexit
+import sys
+import re
 import json
 import os
-import mimetypes
-import msal
 import uuid
+import time
 import logging
-from pydoc import isdata
-from bs4 import BeautifulSoup
-from fileinput import filename
-from numpy import delete
-from office365.sharepoint.attachments.attachmentfile_creation_information import AttachmentfileCreationInformation
+import traceback
+from logging.handlers import MemoryHandler
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import Tag
+from lxml import etree
 from office365.sharepoint.client_context import ClientContext
-from office365.sharepoint.files import file
-from office365.sharepoint.files.file import File
 from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.listitems.caml.caml_query import CamlQuery
+from office365.runtime.client_request_exception import ClientRequestException
 from configparser import ConfigParser
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#links to other exported pages are logged, they might need to be replaced
+LOG_FILENAME = "logfile.log"
+
+#number of buffered console messages written out at once
+LOG_FLUSH_EVERY = 100
+
+#exports are often multi-MB files on network shares, read them in large chunks
+READ_BUFFER_SIZE = 1 << 20
+
+#runs of whitespace in page link texts
+WHITESPACE_RE = re.compile(r'\s+')
+
+#index.html is only read for the space details table and the page tree
+INDEX_STRAINER = SoupStrainer(class_=["confluenceTable", "pageSection"])
+
+#requests per $batch, SharePoint accepts at most 100
+BATCH_SIZE = 50
+
+#site user lookup by display name, the name must be passed through odata_escape
+USER_FILTER = "title eq '{}'"
+
+#attributes of the SharePoint inline image widget replacing every <img>
+IMG_WRAPPER_ATTRS = {
+    "tabindex": "-1",
+    "data-cke-widget-wrapper": "1",
+    "data-cke-filter": "off",
+    "class": "cke_widget_wrapper cke_widget_block cke_widget_inlineimage cke_widget_wrapper_webPartInRteInlineImage cke_widget_wrapper_webPartInRteClear cke_widget_wrapper_webPartInRteAlignCenter cke_widget_wrapper_webPartInRte",
+    "data-cke-display-name": "div",
+    "data-cke-widget-id": "5",
+    "role": "region",
+    "aria-label": "Inline image in RTE. Use Alt + F11 to go to toolbar. Use Alt + P to open the property pane.",
+    "contenteditable": "false",
+}
+IMG_WEBPART_ATTRS = {
+    "data-webpart-id": "image",
+    "class": "webPartInRte webPartInRteAlignCenter webPartInRteClear webPartInRteInlineImage cke_widget_element",
+    "data-cke-widget-data": "%7B%22classes%22%3A%7B%22webPartInRteInlineImage%22%3A1%2C%22webPartInRteClear%22%3A1%2C%22webPartInRteAlignCenter%22%3A1%2C%22webPartInRte%22%3A1%7D%7D",
+    "data-cke-widget-upcasted": "1",
+    "data-cke-widget-keep-attr": "0",
+    "data-widget": "inlineimage",
+    "title": "",
+}
+
+#constant parts of the image web part added to the canvas for every <img>, shared between entries
+IMG_CONTROL = {
+    "position": {
+        "layoutIndex": 1,
+        "zoneIndex": 1,
+        "sectionIndex": 1,
+        "sectionFactor": 12,
+        "controlIndex": 0
+    },
+    "controlType": 3,
+    "webPartId": "d1d91016-032f-456d-98a4-721247c305e8",
+    "rteInstanceId": "7802ec32-078a-42a7-b455-8eae2538781f",
+    "addedFromPersistedData":'true',
+    "reservedHeight": 160,
+    "reservedWidth": 1178,
+}
+IMG_WEBPART_DATA = {
+    "id": "d1d91016-032f-456d-98a4-721247c305e8",
+    "title": "Image",
+    "description": "Add an image, picture or photo to your page including text overlays and ability to crop and resize images.",
+    "audiences": [],
+    "dataVersion": "1.11",
+    "containsDynamicDataSource":'false',
+}
+IMG_PROPERTIES = {
+    "linkUrl": "",
+    "isInlineImage":'true',
+    "imgHeight": 134,
+    "imgWidth": 352,
+    "imageSourceType": 2,
+    "alignment": "Center",
+    "fixAspectRatio":'false',
+    "overlayText": "",
+    "altText": "",
+}
+
+#text web part holding the page HTML, "innerHTML" is added per page
+CANVAS_TEXT_CONTROL = {
+    "controlType": 4,
+    "id": "7802ec32-078a-42a7-b455-8eae2538781f",
+    "position": {
+        "layoutIndex": 1,
+        "zoneIndex": 1,
+        "sectionIndex": 1,
+        "sectionFactor": 12,
+        "controlIndex": 1
+    },
+    "addedFromPersistedData":'true',
+}
+
+#page settings closing every canvas, the same for all pages
+CANVAS_PAGE_SETTINGS = {
+    "controlType": 0,
+    "pageSettingsSlice": {
+        "isDefaultDescription":'true',
+        "isDefaultThumbnail":'true',
+        "isSpellCheckEnabled":'true',
+        "globalRichTextStylingVersion": 0,
+        "rtePageSettings": {
+            "contentVersion": 4
+        }
+    }
+}
+
+def _json_default(obj):
+    """
+    Serializes the values orjson does not support the way SetEncoder does.
+
+    Parameters:
+    - obj: The value to serialize.
+
+    Returns:
+    - list: The items of a set.
+
+    Raises:
+    - TypeError: If the value is not a set.
+    """
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_json(obj):
+    """
+    Serializes an object to a JSON string, with orjson when it is installed.
+
+    Sets are serialized as lists and any other unsupported value raises TypeError,
+    with either backend.
+
+    Parameters:
+    - obj: The object to serialize.
+
+    Returns:
+    - str: The JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default).decode()
+    return json.dumps(obj, cls=SetEncoder)
+
+def odata_escape(value):
+    """
+    Escapes a value for use inside a quoted OData string literal.
+
+    Parameters:
+    - value (str): The value to escape.
+
+    Returns:
+    - str: The value with single quotes doubled.
+    """
+    return str(value).replace("'", "''")
+
+def uuid4_batch(count):
+    """
+    Generates random (version 4) UUID strings from a single os.urandom call.
+
+    SharePoint expects the hyphenated form, so the strings match str(uuid.uuid4()).
+
+    Parameters:
+    - count (int): Number of UUIDs to generate.
+
+    Returns:
+    - list: The UUID strings.
+    """
+    rand = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=rand[i:i + 16], version=4)) for i in range(0, 16 * count, 16)]
+
+def error_origin(error):
+    """
+    Returns the name of the function of this module an exception was raised in.
+
+    Parameters:
+    - error (Exception): The exception.
+
+    Returns:
+    - str: The function name, the one recorded by build_page for exceptions raised in a parse worker.
+    """
+    origin = getattr(error, "origin", None)
+    if origin is None:
+        #skip frames of the libraries called
+        frames = [frame for frame in traceback.extract_tb(error.__traceback__) if frame.filename == __file__]
+        origin = frames[-1].name if frames else "unknown"
+    return origin
+
+def _init_parse_worker():
+    """
+    Resets the console buffer inherited from the parent process, including a lock another thread may have held.
+    """
+    ConfluencToSharePoint._log_buf = io.StringIO()
+    ConfluencToSharePoint._log_lock = threading.Lock()
+    ConfluencToSharePoint._log_count = 0
+
+def build_page(page_path, elements_to_remove, page_settings):
+    """
+    Parses a page file and builds its SharePoint page canvas in a parse worker process.
+
+    The SharePoint connection stays in the parent process, the worker only gets a
+    parser carrying the picklable settings returned by `_page_settings`.
+
+    Parameters:
+    - page_path (str): Path of the page HTML file.
+    - elements_to_remove (frozenset): Class names of the HTML elements to remove from the parsed content.
+    - page_settings (dict): The settings snapshot of the importer.
+
+    Returns:
+    - dict: The page parts, see `ConfluencToSharePoint._build_page`.
+    """
+    parser = ConfluencToSharePoint.__new__(ConfluencToSharePoint)
+    parser.__dict__.update(page_settings)
+    try:
+        return parser._build_page(page_path, elements_to_remove)
+    except Exception as e:
+        #the traceback is not sent back to the parent process, keep where it was raised
+        e.origin = error_origin(e)
+        raise
+    finally:
+        ConfluencToSharePoint.flush_messages()
 
 class ConfluencToSharePoint():
+    #console output is buffered, shared by all threads
+    _log_buf = io.StringIO()
+    _log_lock = threading.Lock()
+    _log_count = 0
         
     def __init__(self, settings_file):
         """
@@ -36,11 +267,18 @@ class ConfluencToSharePoint():
         - list_name (str): Name of the SharePoint list to interact with.
         - assets_folder (str): Path to the assets folder.
         - client_credentials (ClientCredential): SharePoint client credentials.
-        - ctx (ClientContext): Client context for interacting with the SharePoint site.
-        - ll_list: The SharePoint list object.
-        - windows_path (dict): Windows paths evaluated from settings.
+        - ctx (ClientContext): Client context for interacting with the SharePoint site (one per thread).
+        - ll_list: The SharePoint list object (one per thread).
+        - workers (int): Number of pages processed concurrently.
+        - parse_processes (int): Number of processes parsing page files, 0 (default) to parse in the page threads.
+        - upload_concurrency (int): Number of attachments uploaded concurrently.
+        - max_retry (int): Number of attempts for a throttled SharePoint request.
+        - retry_timeout (int): Initial wait in seconds before retrying, doubled on every attempt.
+        - windows_path (bool): Whether the export uses Windows paths, read from settings.
         - site: The SharePoint site object.
         - web: The root web of the SharePoint site.
+        - _assets_main_path (str): URL of the assets folder attachment paths are prefixed with.
+        - _image_location (dict): Site, web and list ids of the inline image web parts.
 
         Raises:
         - Exception: If there is an error setting up client credentials or querying the site.
@@ -50,17 +288,41 @@ class ConfluencToSharePoint():
         self.site_url = self.settings.get('default', 'site_url')
         self.list_name = self.settings.get('default', 'list_name')
         self.assets_folder = self.settings.get('default', 'assets_folder')
+        self.workers = self.settings.getint('default', 'workers', fallback=8)
+        self.parse_processes = self.settings.getint('default', 'parse_processes', fallback=0)
+        #every request is sent at least once
+        self.max_retry = max(1, self.settings.getint('default', 'max_retry', fallback=5))
+        self.retry_timeout = self.settings.getint('default', 'retry_timeout', fallback=1)
+        self.upload_concurrency = self.settings.getint('default', 'upload_concurrency', fallback=8)
+        #ClientContext is not thread-safe, every worker thread gets its own
+        self._local = threading.local()
+        self._request_semaphore = threading.BoundedSemaphore(self.workers)
+        #set for a parse_confluence_HTML run, so its threads, and their client contexts, are reused across pages
+        self._upload_executor = None
+        #records are written to the log file in batches, the host application's logging is left alone
+        self._log = logging.getLogger(__name__)
+        if not self._log.handlers:#set up by an earlier instance
+            file_handler = logging.FileHandler(LOG_FILENAME, delay=True)
+            file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+            self._log.addHandler(MemoryHandler(1024, target=file_handler))
+            self._log.setLevel(logging.INFO)
+            self._log.propagate = False
 
         try:
             self.client_credentials = ClientCredential(
                 self.settings.get('client_credentials', 'client_id'),
                 self.settings.get('client_credentials', 'client_secret')
             )
-            self.ctx = ClientContext(self.site_url).with_credentials(self.client_credentials)        
-            self.ll_list = self.ctx.web.lists.get_by_title(self.list_name).get().execute_query()
-            self.windows_path = eval(self.settings.get('default', 'windows_path'))
-            self.site = self.ctx.site.get().execute_query()
-            self.web = self.ctx.site.root_web.get().execute_query()
+            self.ll_list  # load the list for the main thread
+            self.windows_path = self.settings.getboolean('default', 'windows_path')
+            self._sep = "\\" if self.windows_path else "/"
+            self.site = self._execute_query(self.ctx.site.get())
+            self.web = self._execute_query(self.ctx.site.root_web.get())
+            #page canvases are built from these only, so it can be done without a client context
+            self._assets_main_path = f"{self.ctx._base_url}/{self.assets_folder}"
+            self._image_location = {"siteId": self.site.id, "webId": self.web.id, "listId": "{" + self.ll_list.id + "}"}
+            #site users by title, authors recur across pages
+            self._user_cache = {user.properties.get('Title'): user for user in self._execute_query(self.ctx.web.site_users.get())}
         except Exception as e:
             if 'AADSTS700016' in str(e):
                 self.print_error("Error: Application with identifier was not found in the directory.")
@@ -69,6 +331,156 @@ class ConfluencToSharePoint():
                 self.print_error(f"An unexpected error occurred while setting up client credentials: {e}")            
             raise
 
+    @property
+    def ctx(self):
+        """
+        Returns the SharePoint client context of the calling thread, creating it on first use.
+        """
+        ctx = getattr(self._local, "ctx", None)
+        if ctx is None:
+            ctx = ClientContext(self.site_url).with_credentials(self.client_credentials)
+            self._local.ctx = ctx
+        return ctx
+
+    @property
+    def assets_folder(self):
+        """
+        Returns the SharePoint folder attachments are uploaded to.
+        """
+        return self._assets_folder
+
+    @assets_folder.setter
+    def assets_folder(self, value):
+        """
+        Sets the attachments folder, keeping the cached folder URL in sync once it exists.
+        """
+        self._assets_folder = value
+        if "_assets_main_path" in self.__dict__:
+            self._assets_main_path = f"{self.ctx._base_url}/{value}"
+
+    @property
+    def ll_list(self):
+        """
+        Returns the SharePoint list loaded through the calling thread's client context.
+        """
+        ll_list = getattr(self._local, "ll_list", None)
+        if ll_list is None:
+            ll_list = self._execute_query(self.ctx.web.lists.get_by_title(self.list_name).get())
+            self._local.ll_list = ll_list
+        return ll_list
+
+    def _execute_query(self, client_object):
+        """
+        Executes the pending queries of the calling thread's client context.
+
+        Concurrent requests are capped by a semaphore shared by all threads and
+        throttled requests (429/503) are retried with exponential backoff, honouring
+        the Retry-After header when SharePoint sends one.
+
+        Parameters:
+        - client_object: The client object the pending queries load into.
+
+        Returns:
+        - The loaded client object.
+
+        Raises:
+        - ClientRequestException: If a request fails, or is still throttled after max_retry attempts.
+        - requests.RequestException: If SharePoint cannot be reached.
+        """
+        for retry in range(1, self.max_retry + 1):
+            try:
+                with self._request_semaphore:
+                    self.ctx.execute_query()
+                return client_object
+            except ClientRequestException as e:
+                delay = self._retry_delay(e, retry)
+                if delay is None:
+                    self._reset_context()
+                    raise
+                #the failed query was dequeued, put it back in front of the remaining ones
+                self.ctx.add_query(self.ctx.current_query, True)
+                time.sleep(delay)
+            except Exception:
+                #e.g. a connection error, the rest of the queue must not be sent with the next page
+                self._reset_context()
+                raise
+
+    def _execute_batch(self):
+        """
+        Sends the pending queries of the calling thread's client context as $batch requests.
+
+        Queries are chunked to stay below the SharePoint limit of 100 requests per $batch.
+        A throttled (429/503) chunk is sent again with the same backoff as `_execute_query`.
+
+        Returns:
+        - ClientContext: The client context of the calling thread.
+
+        Raises:
+        - ClientRequestException: If a request fails, or is still throttled after max_retry attempts.
+        """
+        #execute_batch takes the whole queue, keep the queries to resend a throttled chunk
+        queries = list(self.ctx.pending_request())
+        for i in range(0, len(queries), BATCH_SIZE):
+            for retry in range(1, self.max_retry + 1):
+                for qry in queries[i:i + BATCH_SIZE]:
+                    self.ctx.add_query(qry)
+                try:
+                    with self._request_semaphore:
+                        self.ctx.execute_batch(items_per_batch=BATCH_SIZE)
+                    break
+                except ClientRequestException as e:
+                    delay = self._retry_delay(e, retry)
+                    if delay is None:
+                        self._reset_context()
+                        raise
+                    self.ctx.clear()
+                    time.sleep(delay)
+                except Exception:
+                    self._reset_context()
+                    raise
+        return self.ctx
+
+    def _reset_context(self):
+        """
+        Drops the calling thread's client context and list, a new one is created on next use.
+
+        A failed request can leave queries and response callbacks (e.g. the next chunk of an
+        upload session) registered on the context, clearing its queue does not remove them.
+        """
+        self._local.ctx = None
+        self._local.ll_list = None
+
+    def _retry_delay(self, error, retry):
+        """
+        Returns how long to wait before retrying a failed request.
+
+        Only throttled requests (429/503) are retried, after the Retry-After delay SharePoint
+        sends or an exponential backoff starting at retry_timeout.
+
+        Parameters:
+        - error (ClientRequestException): The error the request failed with.
+        - retry (int): The number of the failed attempt, starting at 1.
+
+        Returns:
+        - int: The delay in seconds, None if the request must not be retried.
+        """
+        status = error.response.status_code if error.response is not None else None
+        if status not in (429, 503) or retry == self.max_retry:
+            return None
+        retry_after = error.response.headers.get("Retry-After", "")
+        delay = int(retry_after) if retry_after.isdigit() else self.retry_timeout * 2 ** (retry - 1)
+        self.print_error(f"Request throttled ({status}), retry {retry} of {self.max_retry - 1} in {delay}s...")
+        return delay
+
+    def _page_settings(self):
+        """
+        Returns the settings a parse worker process needs to build page canvases.
+
+        Returns:
+        - dict: The instance attributes copied to the worker's parser.
+        """
+        return {"_assets_main_path": self._assets_main_path, "_image_location": self._image_location}
+
     def load_settings(self):
         """
         Loads settings from the provided settings file.
@@ -106,6 +518,7 @@ class ConfluencToSharePoint():
 
         This method checks if the specified path and its index.html file exist, then processes
         each page in the directory, extracting relevant information and uploading attachments.
+        Once a page fails, the pages not started yet are skipped, every failure is reported.
 
         Parameters:
         - path (str): The directory path containing Confluence HTML files.
@@ -113,96 +526,253 @@ class ConfluencToSharePoint():
         - elements_to_remove (list): A list of HTML elements to remove from the parsed content.
 
         Returns:
-        - None: Returns None upon successful completion.
-
-        Raises:
-        - FileNotFoundError: If the specified path does not exist or if index.html is missing.
-        - Exception: If an error occurs during file processing or uploading to SharePoint.
+        - bool: True upon successful completion, False if the path is missing or a page failed.
         """
+        #class names are matched once per element of every page
+        elements_to_remove = frozenset(elements_to_remove)
         try:
-            if not os.path.exists(path) or not os.path.isfile(f"{path}index.html"):
+            try:
+                fp = open(os.path.join(path, "index.html"), 'rb', buffering=READ_BUFFER_SIZE)
+            except FileNotFoundError:
                 self.print_error("Path not found. Check the path name and try again.")
-                raise
+                return False
 
-            with open(f"{path}index.html") as fp:
-                soup = BeautifulSoup(fp, 'html.parser')
+            with fp:
+                soup = BeautifulSoup(fp, 'lxml', parse_only=INDEX_STRAINER)
                 #get page title
-                pageInfo = soup.select(".confluenceTable td")
+                pageInfo = [td for table in soup.find_all(class_="confluenceTable") for td in table.find_all("td")]
                 mainTitle = pageInfo[1].text if len(pageInfo) > 0 else ''
-                pageSection = soup.select(".pageSection li")            
-                #get css
-                css_path = f"{path}styles\\site.css" if self.windows_path else f"{path}styles/site.css"
-                css_file = ""
-                css_str = ""
-                if os.path.exists(css_path):
-                    css_file = open(css_path,"r")
-                    #css_str = f"<style type='text/css'>{compress(css_file.read())}</style>"                
-
-                for page in pageSection:
-                    #page names includes whitespace
-                    page_link = page.select_one("a")
-                    page_title = ' '.join( page_link.text.split())
-                    page_name = f"{page_title}"#{mainTitle}_
-                    page_file = page_link.attrs["href"]
-                    self.print_message(f"Processing {page_name}...")
-                    if os.path.isfile(f"{path}{page_file}"):
-                        with open(f"{path}{page_file}", encoding="utf-8") as fp2:#get page attachments
-                            page_soup = BeautifulSoup(fp2, "html.parser")
-                            main_content = page_soup.select_one("#main-content")
-                            if len(main_content.contents) == 0 or len(main_content.text.rstrip()) == 0 : continue #if empty continue and don't import
-                            attachments = page_soup.select("div.pageSection .greybox a")
-                            page_author = page_soup.select_one(".author")
-                            page_author_name = ""
-                            if page_author: page_author_name = page_author.text
-                            user = self.getSiteUser(page_author_name)
-                            page_author_object = user  
-                            #remove containers by class name
-                            if len(elements_to_remove) > 0:
-                                self.remove_elements(page_soup, elements_to_remove)
-                            if len(attachments) > 0 :
-                                self.uploadPageAttachment(path, attachments)
-                            #fix images path
-                            attachments_obj = main_content.find_all(attrs={"data-linked-resource-type": "attachment"})
-                            if len(attachments_obj) > 0:
-                                self.fixAttachmentsPath(attachments_obj)
-                            #fix anchors
-                            links = main_content.find_all("a", href=True) 
-                            if len(links) > 0:
-                                self.fixAnchors(links, main_content)
-                            page_html = css_str + str(main_content)                        
-                            page_canvas = self.getSPPageCanvas(main_content)
-                            if page_canvas == None:
-                                self.print_error("Issue creating Page Canvas!")
-                                return None
-                            #Create Page
-                            page_canvas_json = json.dumps(page_canvas)
-                            page = self.add_edit_page(page_name, page_canvas_json, page_author_object, sp_fields)                        
-                            links = main_content.find_all("a", href=True)                        
-                            #log file contains all link, might need to be replaced
-                            if len(links) > 0:
-                                self.logLinks(links, page["url"])
-                            #rename file to mark as complete          
-                            self.print_message(f"Completed {page_file}")
-                            fp2.close
-                        os.rename(f"{path}{page_file}",f"{path}{page_file}_complete")
-                        self.print_message(f"{page_file} renamed to {page_file}_complete")
+                pageSection = [li for section in soup.find_all(class_="pageSection") for li in section.find_all("li")]
+
+                #pages are independent, overlap their SharePoint round-trips
+                #parsing is CPU-bound and holds the GIL, it runs in its own processes
+                parse_pool = None
+                if self.parse_processes > 0:
+                    parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes, initializer=_init_parse_worker)
+                self._upload_executor = ThreadPoolExecutor(max_workers=self.upload_concurrency)
+                failed = False
+                try:
+                    with ThreadPoolExecutor(max_workers=self.workers) as ex:
+                        futures = {ex.submit(self._process_page, path, page, elements_to_remove, sp_fields, parse_pool): page for page in pageSection}
+                        for future in as_completed(futures):
+                            if future.cancelled():
+                                continue
+                            error = future.exception()
+                            if error is None:
+                                continue
+                            if not failed:
+                                #stop like a serial import would, pages already running still finish
+                                failed = True
+                                for pending in futures:
+                                    pending.cancel()
+                            #page helpers don't report their own errors
+                            page_file = futures[future].find("a").attrs["href"]
+                            self.print_error(f"An unexpected error occurred in {error_origin(error)} ({page_file}): {error}")
+                finally:
+                    if parse_pool is not None:
+                        parse_pool.shutdown()
+                    self._upload_executor.shutdown()
+                    self._upload_executor = None
+                if failed:
+                    self.flush_messages()
+                    return False
                 #print(pageSection)
                 self.print_message(f"Done!")
+                self.flush_messages()
             return True
         except FileNotFoundError as e:
             self.print_error(f"Error: {e}")
             return False
         except Exception as e:
-            self.print_error(f"An unexpected error occurred: {e}")
+            #page helpers don't report their own errors
+            self.print_error(f"An unexpected error occurred in {error_origin(e)}: {e}")
             return False
 
+    def _process_page(self, path, page_elem, elements_to_remove, sp_fields, parse_pool = None):
+        """
+        Parses a single Confluence page and creates the corresponding SharePoint page.
+
+        This method is run by the worker threads of `parse_confluence_HTML`; every
+        SharePoint call goes through the calling thread's own client context. The page
+        file is parsed in the parse pool if one is given.
+
+        Parameters:
+        - path (str): The directory path containing Confluence HTML files.
+        - page_elem (Tag): The index.html list element linking to the page.
+        - elements_to_remove (frozenset): Class names of the HTML elements to remove from the parsed content.
+        - sp_fields (dict): SharePoint fields to map data to.
+        - parse_pool (ProcessPoolExecutor, optional): The processes parsing page files.
+
+        Returns:
+        - bool: True if the page was processed, skipped as empty or already imported.
+
+        Raises:
+        - Exception: If an error occurs during file processing or uploading to SharePoint.
+        """
+        #page names includes whitespace
+        page_link = page_elem.find("a")
+        page_title = WHITESPACE_RE.sub(' ', page_link.text).strip()
+        page_name = f"{page_title}"#{mainTitle}_
+        page_file = page_link.attrs["href"]
+        self.print_message(f"Processing {page_name}...")
+        page_path = os.path.join(path, page_file)
+        try:
+            if parse_pool is not None:
+                page_parts = parse_pool.submit(build_page, page_path, elements_to_remove, self._page_settings()).result()
+            else:
+                page_parts = self._build_page(page_path, elements_to_remove)
+        except FileNotFoundError:
+            #already imported and renamed, or missing from the export
+            return True
+        if page_parts is None: return True #if empty continue and don't import
+        user = self.getSiteUser(page_parts["author"])
+        page_author_object = user  
+        if len(page_parts["attachments"]) > 0 :
+            self.uploadPageAttachment(path, page_parts["attachments"])
+        #Create Page
+        page = self.add_edit_page(page_name, page_parts["canvas"], page_author_object, sp_fields)                        
+        #log file contains all link, might need to be replaced
+        if len(page_parts["links"]) > 0:
+            self.logLinks(page_parts["links"], page["url"])
+        #rename file to mark as complete          
+        self.print_message(f"Completed {page_file}")
+        os.rename(page_path, f"{page_path}_complete")
+        self.print_message(f"{page_file} renamed to {page_file}_complete")
+        return True
+
+    def _build_page(self, page_path, elements_to_remove):
+        """
+        Parses a page file and builds its SharePoint page canvas.
+
+        Only the settings from `_page_settings` are used, so this can run in a parse
+        worker process. Everything returned is small and picklable.
+
+        Parameters:
+        - page_path (str): Path of the page HTML file.
+        - elements_to_remove (frozenset): Class names of the HTML elements to remove from the parsed content.
+
+        Returns:
+        - dict: The page canvas JSON ("canvas"), the author name ("author"), the attachment
+                <a> tags to upload ("attachments") and detached copies of the page links ("links"),
+                or None if the page is empty.
+
+        Raises:
+        - FileNotFoundError: If the page file does not exist.
+        """
+        main_content, page_author_name, attachments = self._parse_page_file(page_path)
+        if main_content is None or len(main_content.contents) == 0 or len(main_content.text.rstrip()) == 0 : return None
+        #remove containers by class name and collect the rest in one pass
+        attachments_obj, links, images, headings = self._collect_elements(main_content, elements_to_remove)
+        #fix images path
+        if len(attachments_obj) > 0:
+            self.fixAttachmentsPath(attachments_obj)
+        #the links are logged once the page exists, keep their href and text only
+        link_copies = []
+        for link in links:
+            link_copy = Tag(name="a", attrs={"href": link.attrs["href"]})
+            link_copy.string = link.text
+            link_copies.append(link_copy)
+        #fix anchors
+        if len(links) > 0:
+            self.fixAnchors(links, main_content, headings)
+        page_canvas = self.getSPPageCanvas(main_content, images)
+        return {
+            "canvas": dumps_json(page_canvas),
+            "author": page_author_name,
+            "attachments": attachments,
+            "links": link_copies,
+        }
+
+    def _collect_elements(self, main_content, elements_to_remove = frozenset()):
+        """
+        Collects the elements the page fixes work on in a single pass over the content,
+        removing the containers with one of the given class names on the way.
+
+        Parameters:
+        - main_content (Tag): The #main-content element of the page.
+        - elements_to_remove (frozenset, optional): Class names of the elements to remove.
+
+        Returns:
+        - tuple: Lists of the attachment elements (data-linked-resource-type="attachment"),
+                 the <a> tags with an href, the <img> tags and the <h3> tags with an id,
+                 in document order and without the elements that were removed.
+        """
+        attachments_obj, links, images, headings, to_remove = [], [], [], [], []
+        for el in main_content.descendants:
+            name = el.name
+            if name is None:#text, comments
+                continue
+            attrs = el.attrs
+            classes = attrs.get("class")
+            if classes and not elements_to_remove.isdisjoint(classes):
+                to_remove.append((el, next(c for c in classes if c in elements_to_remove)))
+            if attrs.get("data-linked-resource-type") == "attachment":
+                attachments_obj.append(el)
+            if name == "a":
+                if "href" in attrs:
+                    links.append(el)
+            elif name == "img":
+                images.append(el)
+            elif name == "h3":
+                if "id" in attrs:
+                    headings.append(el)
+        if to_remove:
+            for el, class_name in to_remove:
+                #nested in a container removed before it
+                if not el.decomposed:
+                    el.decompose()
+                    self.print_message(f"Removed element: {class_name}")
+            #decompose() marks the whole subtree
+            attachments_obj = [el for el in attachments_obj if not el.decomposed]
+            links = [el for el in links if not el.decomposed]
+            images = [el for el in images if not el.decomposed]
+            headings = [el for el in headings if not el.decomposed]
+        return attachments_obj, links, images, headings
+
+    def _parse_page_file(self, page_path):
+        """
+        Stream-parses a Confluence page file, keeping only the parts needed for the import.
+
+        The file is read incrementally with lxml and every subtree is released once it has
+        been handled, so only the #main-content subtree is ever turned into a BeautifulSoup tree.
+
+        Parameters:
+        - page_path (str): Path of the page HTML file.
+
+        Returns:
+        - tuple: The #main-content Tag (None if missing), the author name and the list of
+                 attachment <a> tags found in the page's .pageSection .greybox blocks.
+
+        Raises:
+        - Exception: If the file cannot be read or parsed.
+        """
+        main_content = None
+        page_author_name = None
+        attachments = []
+        with open(page_path, 'rb', buffering=READ_BUFFER_SIZE) as fp:
+            for _, el in etree.iterparse(fp, events=("end",), html=True, encoding="utf-8"):
+                classes = (el.get("class") or "").split()
+                if el.get("id") == "main-content":
+                    html = etree.tostring(el, encoding="unicode", method="html", with_tail=False)
+                    main_content = BeautifulSoup(html, 'lxml').find(id="main-content")
+                    el.clear()
+                elif "author" in classes and page_author_name is None:
+                    page_author_name = "".join(el.itertext())
+                elif el.tag == "div" and "pageSection" in classes:
+                    for greybox in el.xpath(".//*[contains(concat(' ', normalize-space(@class), ' '), ' greybox ')]"):
+                        attachments += [Tag(name="a", attrs=dict(a.attrib)) for a in greybox.iter("a")]
+                    #still needed if it sits inside #main-content, which has not ended yet
+                    if not any(parent.get("id") == "main-content" for parent in el.iterancestors()):
+                        el.clear()
+        return main_content, page_author_name or "", attachments
+
     def getSiteUser(self, full_name):
         """
         Retrieves a SharePoint site user based on the provided full name.
 
         This method filters the site users by the given full name and loads the user data
         from SharePoint. If a matching user is found, it returns the user object; otherwise,
-        it returns None.
+        it returns None. Results, including misses, are cached by full name.
 
         Parameters:
         - full_name (str): The full name of the user to search for.
@@ -218,16 +788,18 @@ class ConfluencToSharePoint():
             if full_name == "":
                 self.print_error("Full name cannot be empty.")
                 return None
+            if full_name in self._user_cache:
+                return self._user_cache[full_name]
 
-            users = self.ctx.web.site_users.filter(f"title eq '{full_name}'")
+            users = self.ctx.web.site_users.filter(USER_FILTER.format(odata_escape(full_name)))
             self.ctx.load(users)
-            self.ctx.execute_query()
+            self._execute_query(users)
 
-            if len(users) > 0:
-                return users[0]
-            else:
+            user = users[0] if len(users) > 0 else None
+            self._user_cache[full_name] = user
+            if user is None:
                 self.print_message("No user found with the specified full name.")
-                return None
+            return user
 
         except Exception as e:
             self.print_error(f"An error occurred while retrieving the user: {e}")
@@ -252,7 +824,7 @@ class ConfluencToSharePoint():
         """
         try:
             for element_to_remove in elements_to_remove:
-                elements = page.select(f".{element_to_remove}")
+                elements = page.find_all(class_=element_to_remove)
                 for element in elements:
                     element.decompose()  # Remove the element from the tree
                     self.print_message(f"Removed element: {element_to_remove}")
@@ -287,7 +859,7 @@ class ConfluencToSharePoint():
                 
                 if os.path.isfile(file_name):
                     page_name = page_name if page_name != "" else os.path.dirname(attachment_file)
-                    attachments_arr.append(file_name.replace("/", "\\") if self.windows_path else file_name)
+                    attachments_arr.append(file_name.replace("/", self._sep))
 
             if attachments_arr:
                 self.add_attachments(attachments_arr, page_name)
@@ -309,7 +881,8 @@ class ConfluencToSharePoint():
         This method checks if each file in the provided list exists on the local file system.
         If the file exists, it checks if a file with the same name already exists in the target
         SharePoint folder. Depending on the `overwrite` parameter, it either uploads the file or 
-        skips the upload if a file with the same name already exists.
+        skips the upload if a file with the same name already exists. Files are uploaded
+        concurrently, in chunks through an upload session.
 
         Parameters:
         - files_to_add (list): A list of file paths to be uploaded to SharePoint.
@@ -322,44 +895,75 @@ class ConfluencToSharePoint():
         Raises:
         - Exception: If an error occurs during file checking or uploading.
         """
-        result = {}
-        size_chunk = 1000000
-        
         try:
             # Ensure the target folder exists
-            target_folder = self.ctx.web.ensure_folder_path(self.assets_folder + "/" + (page_folder or "")).execute_query()
-            folder_files = target_folder.files.get().execute_query()
-
-            for path in files_to_add:
-                result[path] = {}
-                if not os.path.exists(path):
-                    result[path]["result"] = "Not uploaded: File not found. Check the file name and try again"
-                    continue
-                
-                filename = os.path.basename(path)
-                file = folder_files.filter(f"Name eq '{filename}'").get().execute_query()
-
-                if len(file._data) > 0:
-                    if not overwrite:
-                        result[path]["result"] = "Not uploaded: File exists and overwrite is set to false"
-                        result[path]["name"] = file._data[0].name
-                        result[path]["serverRelativeUrl"] = file._data[0].serverRelativeUrl
-                        continue
-                
-                with open(path, 'rb') as fh:
-                    file_content = fh.read()
-                    print(f"Uploading {filename}...")
-                    target_file = target_folder.upload_file(filename, file_content).execute_query()
-                    result[path]["result"] = "File upload completed"
-                    result[path]["name"] = target_file.name
-                    result[path]["serverRelativeUrl"] = target_file.serverRelativeUrl
-
-            return result
+            target_folder = self._execute_query(self.ctx.web.ensure_folder_path(self.assets_folder + "/" + (page_folder or "")))
+            folder_url = target_folder.serverRelativeUrl
+            existing = {}
+            if not overwrite:
+                folder_files = self._execute_query(target_folder.files.get())
+                #SharePoint file names are case-insensitive
+                existing = {f.name.lower(): f for f in folder_files}
+            #uploads only wait on the network, run them side by side
+            #called on its own, outside of a parse_confluence_HTML run, it uses a pool of its own
+            executor = self._upload_executor or ThreadPoolExecutor(max_workers=self.upload_concurrency)
+            try:
+                uploads = executor.map(
+                    lambda path: self._upload_one(path, folder_url, existing.get(os.path.basename(path).lower())), files_to_add)
+                return dict(zip(files_to_add, uploads))
+            finally:
+                if executor is not self._upload_executor:
+                    executor.shutdown()
 
         except Exception as e:
             self.print_error(f"An error occurred while adding attachments: {e}")
             return {file: {"result": "Upload failed due to an error."} for file in files_to_add}
 
+    def _upload_one(self, path, folder_url, existing_file = None):
+        """
+        Uploads a single file to a SharePoint folder using the calling thread's client context.
+
+        Parameters:
+        - path (str): Local path of the file to upload.
+        - folder_url (str): Server relative URL of the target SharePoint folder.
+        - existing_file (File, optional): The file with the same name already in the folder,
+                                          the upload is skipped if given.
+
+        Returns:
+        - dict: The upload status of the file.
+
+        Raises:
+        - Exception: If an error occurs during file checking or uploading.
+        """
+        result = {}
+        size_chunk = 1000000
+
+        try:
+            file_size = os.path.getsize(path)
+        except OSError:
+            result["result"] = "Not uploaded: File not found. Check the file name and try again"
+            return result
+
+        if existing_file is not None:
+            result["result"] = "Not uploaded: File exists and overwrite is set to false"
+            result["name"] = existing_file.name
+            result["serverRelativeUrl"] = existing_file.serverRelativeUrl
+            return result
+
+        target_folder = self.ctx.web.get_folder_by_server_relative_url(folder_url)
+        filename = os.path.basename(path)
+
+        def print_progress(offset):
+            self.print_message(f"Uploaded {offset} of {file_size} bytes of {filename}")
+
+        # Upload in size_chunk pieces so large files are never held in memory
+        self._write_log(f"Uploading {filename}...\n")
+        target_file = self._execute_query(target_folder.files.create_upload_session(path, size_chunk, print_progress))
+        result["result"] = "File upload completed"
+        result["name"] = target_file.name
+        result["serverRelativeUrl"] = target_file.serverRelativeUrl
+        return result
+
     def get_item(self, field, value):
         """
         Retrieves a specific item from the SharePoint list based on a field and its corresponding value.
@@ -378,7 +982,7 @@ class ConfluencToSharePoint():
         - Exception: If an error occurs during the query execution.
         """
         try:
-            ll_item = self.ll_list.items.get().filter(f"{field} eq '{value}'").execute_query()
+            ll_item = self._execute_query(self.ll_list.items.get().filter(f"{field} eq '{odata_escape(value)}'"))
             if len(ll_item._data) > 0:
                 return ll_item._data[0].properties
             else:
@@ -389,7 +993,7 @@ class ConfluencToSharePoint():
             self.print_error(f"An error occurred while retrieving the item: {e}")
             return None
 
-    def update_item(self, id, params):
+    def update_item(self, id, params, execute = True):
         """
         Updates a specific item in the SharePoint list with the provided parameters.
 
@@ -401,6 +1005,8 @@ class ConfluencToSharePoint():
         - id (int): The ID of the item to be updated.
         - params (dict): A dictionary containing the properties to update, with field names as keys 
                          and the corresponding new values.
+        - execute (bool, optional): Whether to send the batch now or leave the update queued
+                         for the caller's batch.
 
         Returns:
         - dict: The result of the update operation.
@@ -409,13 +1015,18 @@ class ConfluencToSharePoint():
         - Exception: If an error occurs during the update process.
         """
         try:
-            item = self.ll_list.get_item_by_id(id)
-            ll_item = item.get().execute_query()
+            ll_item = self.ll_list.get_item_by_id(id)
 
             for k, v in params.items():
                 ll_item.set_property(k, v)
-
-            result = self.ctx.execute_batch()  # Execute the batch update
+            #the item's own parent list is not loaded, in a batch its type would never resolve
+            #and the update would be sent as SP.ListItem
+            ll_item.ensure_type_name(self.ll_list)
+            ll_item.update()
+
+            if not execute:
+                return ll_item
+            result = self._execute_batch()  # Execute the batch update
             return result
 
         except Exception as e:
@@ -443,29 +1054,12 @@ class ConfluencToSharePoint():
         Raises:
         - Exception: If an error occurs while adding or editing the page.
         """
-        
-        def create_page_query():
-            qry = CamlQuery()
-            qry.ViewXml = f"""
-                <View Scope='RecursiveAll'>
-                <Query>
-                    <OrderBy  Override = "TRUE">
-                        <FieldRef Name="Created" Ascending="FALSE"/>
-                    </OrderBy>
-                </Query>
-                
-                <QueryOptions><QueryThrottleMode>Override</QueryThrottleMode></QueryOptions>
-                <RowLimit Paged='TRUE'>1</RowLimit>
-            </View>
-            """
-            return qry
-
         try:
             if page_id is not None:
-                page = self.ctx.site_pages.pages.get().filter(f"Id eq {page_id}").execute_query()
+                page = self._execute_query(self.ctx.site_pages.pages.get().filter(f"Id eq {page_id}"))
                 if len(page._data) > 0:
                     site_page = page._data[0]
-                    site_page.checkout_page().execute_query()
+                    self._execute_query(site_page.checkout_page())
                 else:
                     return None
             else:
@@ -475,7 +1069,7 @@ class ConfluencToSharePoint():
             author_title = author.properties.get('Title', "") if author else ""
 
             # Create empty canvas
-            site_page.layout_web_parts_content = json.dumps([
+            site_page.layout_web_parts_content = dumps_json([
                 {
                     "id": "cbe7b0a9-3504-44dd-a3a3-0e5cacd07788",
                     "instanceId": "cbe7b0a9-3504-44dd-a3a3-0e5cacd07788",
@@ -517,31 +1111,28 @@ class ConfluencToSharePoint():
             ])
 
             site_page.save_draft(page_name)
-            site_page.publish().execute_query()
+            self._execute_query(site_page.publish())
 
-            # Retrieve page information after publishing
-            if page_id is not None:
-                item_page = self.ll_list.items.get().filter(f"Id eq {page_id}").execute_query()
-            else:
-                item_page = self.ll_list.get_items(create_page_query()).execute_query()
+            # Retrieve page information after publishing, a site page has the id of its list item
+            item_page = self._execute_query(self.ll_list.items.get().filter(f"Id eq {site_page.properties['Id']}"))
 
             page_id = None
             if len(item_page._data) > 0:
                 data = item_page._data[0]
-                file = data.file.get().execute_query()
                 page_id = data.id
-                page_url = file.serverRelativeUrl
-
-                if sp_fields:
-                    self.update_item(page_id, sp_fields)  # Update SharePoint fields if provided
 
                 if attachments:
                     self.add_attachments(attachments, page_id)  # Add attachments if provided
 
-                # Set page canvas and publish again
-                site_page.checkout_page().execute_query()
+                # Queue the file lookup, field updates and the canvas publish as one batch
+                file = data.file.get()
+                if sp_fields:
+                    self.update_item(page_id, sp_fields, execute=False)  # Update SharePoint fields if provided
+                site_page.checkout_page()
                 site_page.save_draft(page_name, page_canvas)
-                site_page.publish().execute_query()
+                site_page.publish()
+                self._execute_batch()
+                page_url = file.serverRelativeUrl
 
                 return {"id": page_id, "name": page_name, "url": page_url}
 
@@ -551,7 +1142,7 @@ class ConfluencToSharePoint():
 
         return None
     
-    def getSPPageCanvas(self, content):
+    def getSPPageCanvas(self, content, images = None):
         """
         Generates a structured representation of a SharePoint page canvas from the given HTML content.
         
@@ -561,126 +1152,54 @@ class ConfluencToSharePoint():
 
         Parameters:
             content (BeautifulSoup): The HTML content to process, containing <img> tags.
+            images (list, optional): The <img> tags of the content, if already collected.
 
         Returns:
             list: A list of dictionaries representing the canvas components for SharePoint.
 
         Raises:
-            ValueError: If no <img> tags are found in the content.
-            Exception: If an unexpected error occurs during processing.
+            KeyError: If an <img> tag has no src attribute.
         """
-        try:
-            canvas_dict = []
-            images = content.find_all("img")                        
-            if len(images) > 0:
-                for img in images:
-                    guid = str(uuid.uuid4())
-                    guid2 = str(uuid.uuid4())
-                    guid3 = str(uuid.uuid4())
-                    img_src = img['src']
-                    
-                    soup = BeautifulSoup(f"""<div tabindex='-1' data-cke-widget-wrapper='1' data-cke-filter='off'
-                        class='cke_widget_wrapper cke_widget_block cke_widget_inlineimage cke_widget_wrapper_webPartInRteInlineImage cke_widget_wrapper_webPartInRteClear cke_widget_wrapper_webPartInRteAlignCenter cke_widget_wrapper_webPartInRte'
-                        data-cke-display-name='div' data-cke-widget-id='5' role='region'
-                        aria-label='Inline image in RTE. Use Alt + F11 to go to toolbar. Use Alt + P to open the property pane.'
-                        contenteditable='' false''>
-                        <div data-webpart-id='image'
-                            class='webPartInRte webPartInRteAlignCenter webPartInRteClear webPartInRteInlineImage cke_widget_element'
-                            data-cke-widget-data='%7B%22classes%22%3A%7B%22webPartInRteInlineImage%22%3A1%2C%22webPartInRteClear%22%3A1%2C%22webPartInRteAlignCenter%22%3A1%2C%22webPartInRte%22%3A1%7D%7D'
-                            data-cke-widget-upcasted='1' data-cke-widget-keep-attr='0' data-widget='inlineimage'
-                            data-instance-id='{guid}' title=''></div>
-                        </div>
-                        """, 'html.parser')
-                    img.replace_with(soup)
-                    
-                    canvas_dict.append({
-                        "position": {
-                            "layoutIndex": 1,
-                            "zoneIndex": 1,
-                            "sectionIndex": 1,
-                            "sectionFactor": 12,
-                            "controlIndex": 0
-                        },
-                        "controlType": 3,
-                        "id": guid,
-                        "webPartId": "d1d91016-032f-456d-98a4-721247c305e8",
-                        "rteInstanceId": "7802ec32-078a-42a7-b455-8eae2538781f",
-                        "addedFromPersistedData":'true',
-                        "reservedHeight": 160,
-                        "reservedWidth": 1178,
-                        "webPartData": {
-                            "id": "d1d91016-032f-456d-98a4-721247c305e8",
-                            "instanceId": guid,
-                            "title": "Image",
-                            "description": "Add an image, picture or photo to your page including text overlays and ability to crop and resize images.",
-                            "audiences": [],
-                            "serverProcessedContent": {
-                                "htmlStrings": {},
-                                "searchablePlainTexts": {},
-                                "imageSources": {
-                                    "imageSource": img_src
-                                },
-                                "links": {},
-                                "customMetadata": {
-                                    "imageSource": {
-                                        "siteId": self.site.id,
-                                        "webId": self.web.id,
-                                        "listId": "{" + self.ll_list.id + "}",
-                                        "uniqueId": guid2,
-                                        "width": 352,
-                                        "height": 134
-                                    }
-                                }
-                            },
-                            "dataVersion": "1.11",
-                            "properties": {
-                                "id": guid3,
-                                "linkUrl": "",
-                                "isInlineImage":'true',
-                                "siteId": self.site.id,
-                                "webId": self.web.id,
-                                "listId": "{" + self.ll_list.id + "}",
-                                "uniqueId": guid2,
-                                "imgHeight": 134,
-                                "imgWidth": 352,
-                                "imageSourceType": 2,
-                                "alignment": "Center",
-                                "fixAspectRatio":'false',
-                                "overlayText": "",
-                                "altText": ""
+        canvas_dict = []
+        if images is None:
+            images = content.find_all("img")
+        if len(images) > 0:
+            guids = uuid4_batch(3 * len(images))
+            for i, img in enumerate(images):
+                guid, guid2, guid3 = guids[3 * i:3 * i + 3]
+                img_src = img['src']
+                
+                wrapper = Tag(name="div", attrs=IMG_WRAPPER_ATTRS)
+                wrapper.append(Tag(name="div", attrs={**IMG_WEBPART_ATTRS, "data-instance-id": guid}))
+                img.replace_with(wrapper)
+                
+                image_location = {**self._image_location, "uniqueId": guid2}
+                canvas_dict.append({
+                    **IMG_CONTROL,
+                    #the nested values of the constants are copied, callers may modify the canvas
+                    "position": {**IMG_CONTROL["position"]},
+                    "id": guid,
+                    "webPartData": {
+                        **IMG_WEBPART_DATA,
+                        "audiences": [],
+                        "instanceId": guid,
+                        "serverProcessedContent": {
+                            "htmlStrings": {},
+                            "searchablePlainTexts": {},
+                            "imageSources": {
+                                "imageSource": img_src
                             },
-                            "containsDynamicDataSource":'false'
-                        }
-                    })
-            canvas_dict.append({
-                "controlType": 4,
-                "id": "7802ec32-078a-42a7-b455-8eae2538781f",
-                "position": {
-                    "layoutIndex": 1,
-                    "zoneIndex": 1,
-                    "sectionIndex": 1,
-                    "sectionFactor": 12,
-                    "controlIndex": 1
-                },
-                "addedFromPersistedData":'true',
-                "innerHTML": str(content)
-            })
-            canvas_dict.append({
-                "controlType": 0,
-                "pageSettingsSlice": {
-                    "isDefaultDescription":'true',
-                    "isDefaultThumbnail":'true',
-                    "isSpellCheckEnabled":'true',
-                    "globalRichTextStylingVersion": 0,
-                    "rtePageSettings": {
-                        "contentVersion": 4
+                            "links": {},
+                            "customMetadata": {
+                                "imageSource": {**image_location, "width": 352, "height": 134}
+                            }
+                        },
+                        "properties": {**IMG_PROPERTIES, **image_location, "id": guid3}
                     }
-                }
-            })
-            return canvas_dict
-        except Exception as e:
-            self.print_error(f"An error occurred while processing the images: {str(e)}")
-            raise
+                })
+        canvas_dict.append({**CANVAS_TEXT_CONTROL, "position": {**CANVAS_TEXT_CONTROL["position"]}, "innerHTML": content.decode(formatter="minimal")})
+        canvas_dict.append(copy.deepcopy(CANVAS_PAGE_SETTINGS))
+        return canvas_dict
 
     def fixAttachmentsPath(self, attachments):
         """
@@ -691,53 +1210,55 @@ class ConfluencToSharePoint():
 
         Returns:
             bool: True if the operation was successful.
-
-        Raises:
-            Exception: If an unexpected error occurs while processing attachments.
         """
-        try:
-            main_path = f"{self.ctx._base_url}/{self.assets_folder}"
-            for attachment in attachments:
-                if attachment.name == 'a':#link
-                    attachment['href'] = f"{main_path}/{attachment['href']}"
-                elif attachment.name == 'img':
-                    attachment['src'] = attachment['href'] = f"{main_path}/{attachment['src']}"                    
-            return True
-        except Exception as e:
-            self.print_error(f"An error occurred while fixing attachment paths: {str(e)}")
-            return False
+        main_path = self._assets_main_path
+        links = [attachment for attachment in attachments if attachment.name == 'a']
+        images = [attachment for attachment in attachments if attachment.name == 'img']
+        prefix = main_path + "/"
+        #tags without the attribute are left as they are
+        for link in links:
+            attrs = link.attrs
+            href = attrs.get('href')
+            if href is not None:
+                attrs['href'] = prefix + href
+        for image in images:
+            attrs = image.attrs
+            src = attrs.get('src')
+            if src is not None:
+                attrs['src'] = attrs['href'] = prefix + src
+        return True
         
 
-    def fixAnchors(self, links, main_content):
+    def fixAnchors(self, links, main_content, headings = None):
         """
         Converts links that reference anchors into corresponding <a> tags with <h3> tags as their text.
 
         Parameters:
             links (list): A list of BeautifulSoup tags representing the links to process.
             main_content (BeautifulSoup): The main content from which to find corresponding <h3> tags.
+            headings (list, optional): The <h3> tags with an id of the content, if already collected.
 
         Returns:
             bool: True if the operation was successful.
-
-        Raises:
-            Exception: If an unexpected error occurs while processing anchors.
         """
-        try:
-            for link in links:   
-                href = link["href"]           
-                if href != "" and href[0] == "#":
-                    anchor = main_content.find("h3", {"id":href.replace("#","")})
-                    if anchor:
-                        anchor.name = "a"
-                        soup = BeautifulSoup()
-                        h3 = soup.new_tag("h3")
-                        h3.string = anchor.text.strip()
-                        anchor.string = ""
-                        anchor.append(h3)
-            return True
-        except Exception as e:
-            self.print_error(f"An error occurred while fixing attachment paths: {str(e)}")
-            raise
+        #first <h3> for every id, like main_content.find would return
+        h3_by_id = {}
+        if headings is None:
+            headings = main_content.find_all("h3", id=True)
+        for h3 in headings:
+            h3_by_id.setdefault(h3.attrs["id"], h3)
+        for link in links:   
+            href = link.attrs["href"]           
+            if href.startswith("#"):
+                anchor = h3_by_id.get(href[1:])
+                if anchor:
+                    anchor.name = "a"
+                    text = anchor.get_text().strip()
+                    anchor.clear()
+                    h3 = Tag(name="h3")
+                    h3.string = text
+                    anchor.append(h3)
+        return True
 
     def logLinks(self, links, page_url):
         """
@@ -749,49 +1270,68 @@ class ConfluencToSharePoint():
 
         Returns:
             bool: True if the operation was successful.
-
-        Raises:
-            Exception: If an unexpected error occurs while logging links.
         """
-        try:
-            LOG_FILENAME = "logfile.log"
-            for handler in logging.root.handlers[:]:
-                logging.root.removeHandler(handler)
-            logging.basicConfig(filename=LOG_FILENAME,level=logging.INFO)
-            matches = ["html"]
-            for link in links:   
-                href = link["href"]           
-            if any(match in href for match in matches):
-                text = link.text
-                log = f"Link: {href}. Text: {text}. URL: {page_url}  "
-                logging.info(log)
-            return True
-        except Exception as e:
-            self.print_error(f"An error occurred while logging links: {str(e)}")
-            return False
+        for link in links:
+            href = link.get("href", "")
+            if "html" in href:
+                self._log.info(f"Link: {href}. Text: {link.text}. URL: {page_url}  ")
+        return True
     
-    @staticmethod
-    def print_error(message):
+    @classmethod
+    def print_error(cls, message):
         """
         Prints an error message in red color.
 
+        Buffered messages are flushed first so the output keeps its order.
+
         Parameters:
         - message (str): The error message to be printed.
         """
-        print(f"\033[91m{message}\033[0m")
+        cls._write_log(f"\033[91m{message}\033[0m\n", flush=True)
     
-    @staticmethod
-    def print_message(message):
+    @classmethod
+    def print_message(cls, message):
         """
         Prints a message in green color.
 
+        Messages are buffered and written out every LOG_FLUSH_EVERY messages.
+
         Parameters:
         - message (str): The message to be printed.
         """
-        print(f"\033[92m{message}\033[0m")
+        cls._write_log(f"\033[92m{message}\033[0m\n")
+
+    @classmethod
+    def _write_log(cls, text, flush = False):
+        """
+        Appends text to the console buffer, writing the buffer to stdout when it is full or on request.
+
+        Parameters:
+        - text (str): The text to append.
+        - flush (bool, optional): Whether to write the buffer out now.
+        """
+        with cls._log_lock:
+            cls._log_buf.write(text)
+            cls._log_count += 1
+            if flush or cls._log_count >= LOG_FLUSH_EVERY:
+                sys.stdout.write(cls._log_buf.getvalue())
+                sys.stdout.flush()
+                cls._log_buf.seek(0)
+                cls._log_buf.truncate()
+                cls._log_count = 0
+
+    @classmethod
+    def flush_messages(cls):
+        """
+        Writes all buffered messages to stdout.
+        """
+        cls._write_log("", flush=True)
+
+#messages of methods called outside parse_confluence_HTML are still in the buffer at exit
+atexit.register(ConfluencToSharePoint.flush_messages)
 
 class SetEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, set):
+        if isinstance(obj, (set, frozenset)):
             return list(obj)
         return json.JSONEncoder.default(self, obj)
\ No newline at end of file